@@ -1,6 +1,43 @@
 import socket
 import os
 import sys
+import json
+
+from integrity import DEFAULT_HASH, StreamHasher
+
+CHUNK_SIZE = 64 * 1024
+MAX_FILE_RETRIES = 3
+
+# Digests of files already sent, keyed by (path, size, mtime, algo) and kept
+# next to the client across runs. A repeated push announces the digest first
+# so the server can skip it, without reading the file twice.
+DIGEST_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".digest_cache.json")
+DIGEST_CACHE_LIMIT = 1000
+
+# =========================
+# Persistent digest cache
+# =========================
+def load_digest_cache(path=DIGEST_CACHE_PATH):
+    try:
+        with open(path) as f:
+            entries = json.load(f)
+        return {(p, size, mtime_ns, algo): digest for p, size, mtime_ns, algo, digest in entries}
+    except (OSError, ValueError, TypeError):
+        # missing or unreadable cache: files are simply hashed while sent
+        return {}
+
+def save_digest_cache(cache, path=DIGEST_CACHE_PATH):
+    # keep the most recently added entries only
+    entries = [[*key, digest] for key, digest in cache.items()][-DIGEST_CACHE_LIMIT:]
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"[WARNING] Could not save digest cache: {e}")
+
+DIGEST_CACHE = load_digest_cache()
 
 # =========================
 # Helper function for progress display
@@ -22,27 +59,57 @@ def send_message(sock, message):
 # =========================
 # Send a file
 # =========================
-def send_file(sock, filepath):
+def send_file(sock, filepath, algo=DEFAULT_HASH):
     if not os.path.exists(filepath):
         print("[ERROR] File not found")
         return
 
-    filesize = os.path.getsize(filepath)
+    st = os.stat(filepath)
+    filesize = st.st_size
     filename = os.path.basename(filepath)
 
-    sock.sendall(f"FILE:{filename}|{filesize}".encode())
+    key = (os.path.abspath(filepath), filesize, st.st_mtime_ns, algo)
+    known = DIGEST_CACHE.get(key)
 
-    with open(filepath, "rb") as f:
-        sent = 0
-        while (chunk := f.read(1024)):
-            sock.sendall(chunk)
-            sent += len(chunk)
-            print_progress(sent, filesize)
+    for attempt in range(1, MAX_FILE_RETRIES + 1):
+        if known:
+            sock.sendall(f"FILE:{filename}|{filesize}|{algo}|{known}".encode())
+        else:
+            sock.sendall(f"FILE:{filename}|{filesize}|{algo}".encode())
+        # Wait for the go-ahead so the header never shares a read with the payload
+        if sock.recv(1024).decode() == "FILE_EXISTS":
+            print("[SERVER ALREADY HAS FILE, TRANSFER SKIPPED]")
+            return
 
-    print("\n[FILE TRANSFER COMPLETE]")
-    ack = sock.recv(1024).decode()
-    if ack == "FILE_RECEIVED":
-        print("[SERVER CONFIRMED FILE RECEIPT]")
+        # The digest is computed on the same bytes as they are sent
+        with open(filepath, "rb") as f, StreamHasher(algo) as hasher:
+            sent = 0
+            while (chunk := f.read(CHUNK_SIZE)):
+                hasher.update(chunk)
+                sock.sendall(chunk)
+                sent += len(chunk)
+                print_progress(sent, filesize)
+            digest = hasher.hexdigest()
+        if not known:
+            sock.sendall(digest.encode())
+
+        print("\n[FILE TRANSFER COMPLETE]")
+        ack = sock.recv(1024).decode()
+        if ack == "FILE_RECEIVED":
+            print("[SERVER CONFIRMED FILE RECEIPT]")
+            if DIGEST_CACHE.get(key) != digest:
+                DIGEST_CACHE.pop(key, None)
+                DIGEST_CACHE[key] = digest
+                save_digest_cache(DIGEST_CACHE)
+            return
+        if ack != "FILE_CORRUPT":
+            return
+        # the cached digest may be stale; fall back to sending it after the payload
+        if DIGEST_CACHE.pop(key, None):
+            save_digest_cache(DIGEST_CACHE)
+        known = None
+        print(f"[INTEGRITY CHECK FAILED] Retrying ({attempt}/{MAX_FILE_RETRIES})")
+    print("[ERROR] File could not be delivered intact")
 
 # =========================
 # Main client function
@@ -50,6 +117,8 @@ def send_file(sock, filepath):
 def start_client(server_ip="192.168.64.10", port=8888):
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.connect((server_ip, port))
+    # Chat messages and acks are tiny; don't let Nagle hold them back
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
     try:
         while True:
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import threading
+
+# =========================
+# Content-addressed store for received files
+# =========================
+class ContentStore:
+    """
+    Blobs live once under <root>/.store/<algo>-<digest>; each upload name is a
+    received_<name> view hardlinked to its blob (copied where hardlinks are
+    unsupported). Blob mtimes track last use, and when max_bytes is set the
+    least recently used blobs are evicted together with their views.
+    """
+    def __init__(self, root="received_files", max_bytes=None):
+        self.root = root
+        self.blob_dir = os.path.join(root, ".store")
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+    def blob_path(self, algo, digest):
+        return os.path.join(self.blob_dir, f"{algo}-{digest}")
+
+    def view_path(self, filename):
+        return os.path.join(self.root, f"received_{filename}")
+
+    def incoming(self):
+        """Open a temporary file in the store for an upload in progress."""
+        fd, path = tempfile.mkstemp(dir=self.blob_dir, prefix=".incoming-")
+        return os.fdopen(fd, "wb"), path
+
+    def link(self, algo, digest, filename):
+        """Point filename at an existing blob; False if the content is unknown."""
+        blob = self.blob_path(algo, digest)
+        with self.lock:
+            if not os.path.exists(blob):
+                return False
+            os.utime(blob)
+            self._make_view(blob, filename)
+        return True
+
+    def add(self, tmp_path, algo, digest, filename):
+        """Move a verified upload into the store (or drop it if the content is
+        already stored) and expose it as filename."""
+        blob = self.blob_path(algo, digest)
+        with self.lock:
+            if os.path.exists(blob):
+                # keep the existing inode so earlier views stay linked to the store
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, blob)
+                # mkstemp creates 0600 files; received files were world-readable before
+                os.chmod(blob, 0o644)
+            os.utime(blob)
+            self._make_view(blob, filename)
+            self._evict(keep=blob)
+
+    def _make_view(self, blob, filename):
+        view = self.view_path(filename)
+        try:
+            old = os.stat(view)
+            os.remove(view)
+        except FileNotFoundError:
+            old = None
+        if old and old.st_nlink > 1:
+            self._drop_orphan(old, keep=blob)
+        try:
+            os.link(blob, view)
+        except OSError:
+            shutil.copyfile(blob, view)
+
+    def _drop_orphan(self, view_stat, keep):
+        """Remove the blob a replaced view pointed at once no view links it."""
+        for entry in os.scandir(self.blob_dir):
+            if entry.path == keep or not entry.is_file():
+                continue
+            st = entry.stat()
+            if (st.st_ino, st.st_dev) == (view_stat.st_ino, view_stat.st_dev):
+                if st.st_nlink == 1:
+                    os.remove(entry.path)
+                    print(f"[STORE] Dropped unreferenced {entry.name} ({st.st_size} bytes)")
+                return
+
+    def _evict(self, keep):
+        if not self.max_bytes:
+            return
+        blobs = []
+        for entry in os.scandir(self.blob_dir):
+            if entry.name.startswith(".incoming-") or not entry.is_file():
+                continue
+            blobs.append((entry.stat().st_mtime, entry.path, entry.stat()))
+        total = sum(st.st_size for _, _, st in blobs)
+        for _, path, st in sorted(blobs):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            self._remove_views(st)
+            os.remove(path)
+            total -= st.st_size
+            print(f"[STORE] Evicted {os.path.basename(path)} ({st.st_size} bytes)")
+
+    def _remove_views(self, blob_stat):
+        for entry in os.scandir(self.root):
+            if not entry.is_file():
+                continue
+            st = entry.stat()
+            if (st.st_ino, st.st_dev) == (blob_stat.st_ino, blob_stat.st_dev):
+                os.remove(entry.path)
@@ -8,10 +8,71 @@ import sys
 import os
 import time
 import select
+import struct
+import contextlib
+import errno
+import itertools
+import random
+import signal
+import json
+import hashlib
+import tempfile
 import importlib.util
 import logging
 import readline
 
+# SHARED INTEGRITY HELPERS
+# Inside the repo pycat uses the streaming hasher from ../integrity.py, loaded
+# the same way as plugins. Copied on its own it falls back to the minimal
+# versions below, which hash inline on the transfer thread.
+def load_integrity():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "integrity.py")
+    if not os.path.isfile(path):
+        return None
+    spec = importlib.util.spec_from_file_location("integrity", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+integrity = load_integrity()
+if integrity:
+    DEFAULT_HASH = integrity.DEFAULT_HASH
+    HASH_ALGORITHMS = integrity.HASH_ALGORITHMS
+    StreamHasher = integrity.StreamHasher
+    recv_exact = integrity.recv_exact
+else:
+    DEFAULT_HASH = "blake2b"
+    HASH_ALGORITHMS = ("blake2b", "sha256")
+
+    class StreamHasher:
+        """Standalone fallback with the same interface, hashing inline."""
+        def __init__(self, algo):
+            self._hash = hashlib.new(algo)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+        def update(self, chunk):
+            self._hash.update(chunk)
+
+        def close(self):
+            pass
+
+        def hexdigest(self):
+            return self._hash.hexdigest()
+
+    def recv_exact(sock, n):
+        data = b""
+        while len(data) < n:
+            chunk = sock.recv(n - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
 # 1. PLUGIN SYSTEM
 # We load all .py files in a "plugins" folder. Each plugin must define a
 # "name" string and a "run(args: list[str]) -> str" function.
@@ -46,28 +107,216 @@ def add_file_logger(path):
     fh.setFormatter(fmt)
     logger.addHandler(fh)
 
-# 3. SOCKET WRAPPER: TIMEOUT, RETRY, KEEPALIVE, TLS
-def establish_connection(host, port, timeout, retries, keepalive, tls, cafile):
-    # Attempt connection with timeout and retries
+# 3. SOCKET WRAPPER: TIMEOUT, RETRY, KEEPALIVE, TLS, TRANSPORT TUNING
+# Each mode gets a transport profile. Interactive traffic (chat, shell)
+# disables Nagle so keystrokes are not held back; bulk traffic (file
+# transfer) keeps Nagle, corks header+payload writes into full segments and
+# sizes the kernel buffers to the bandwidth-delay product of the link; the
+# proxy relays both kinds so it gets low latency and sized buffers.
+TRANSPORT_PROFILES = {
+    "interactive": {"nodelay": True, "size_buffers": False},
+    "bulk": {"nodelay": False, "size_buffers": True},
+    "relay": {"nodelay": True, "size_buffers": True},
+    "none": {"nodelay": False, "size_buffers": False},
+}
+MODE_PROFILES = {
+    "server": "interactive",
+    "client": "interactive",
+    "reverse-server": "interactive",
+    "reverse-client": "interactive",
+    "file-server": "bulk",
+    "file-client": "bulk",
+    "proxy": "relay",
+}
+MIN_SOCK_BUF = 64 * 1024
+MAX_SOCK_BUF = 8 * 1024 * 1024
+TCPI_RTT_OFFSET = 68  # offset of tcpi_rtt (usec) in Linux struct tcp_info
+
+def measure_rtt(sock):
+    """Return the kernel's smoothed RTT for a connected socket in seconds, or None."""
+    if not hasattr(socket, "TCP_INFO"):
+        return None
+    try:
+        info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 104)
+    except OSError:
+        return None
+    if len(info) < TCPI_RTT_OFFSET + 4:
+        return None
+    rtt_us = struct.unpack_from("I", info, TCPI_RTT_OFFSET)[0]
+    return rtt_us / 1e6 if rtt_us else None
+
+def buffer_size(rtt, link_mbps):
+    """Twice the bandwidth-delay product, clamped to sane kernel limits."""
+    bdp = int(link_mbps * 1e6 / 8 * rtt)
+    return max(MIN_SOCK_BUF, min(MAX_SOCK_BUF, 2 * bdp))
+
+# Linux limits for each buffer: the ceiling its autotuning may grow to, and
+# the cap an explicit setsockopt is clamped to.
+SOCK_BUF_SYSCTLS = {
+    socket.SO_SNDBUF: ("/proc/sys/net/ipv4/tcp_wmem", "/proc/sys/net/core/wmem_max"),
+    socket.SO_RCVBUF: ("/proc/sys/net/ipv4/tcp_rmem", "/proc/sys/net/core/rmem_max"),
+}
+
+def read_sysctl(path, field=0):
+    try:
+        with open(path) as f:
+            return int(f.read().split()[field])
+    except (OSError, ValueError, IndexError):
+        return None
+
+def tune_socket(sock, profile, link_mbps=100.0, rtt=None):
+    """Apply a transport profile to a connected socket."""
+    opts = TRANSPORT_PROFILES.get(profile or "none", TRANSPORT_PROFILES["none"])
+    if opts["nodelay"]:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if opts["size_buffers"]:
+        rtt = measure_rtt(sock) or rtt
+        if rtt:
+            size = buffer_size(rtt, link_mbps)
+            changed = []
+            for opt, (autotune_path, max_path) in SOCK_BUF_SYSCTLS.items():
+                # Any setsockopt pins the buffer and turns autotuning off, so
+                # only set one when the kernel would otherwise stop short of
+                # size and will actually grant more than autotuning could.
+                ceiling = read_sysctl(autotune_path, 2)
+                if ceiling is None:
+                    # no autotuning limits to go by (not Linux): current size
+                    ceiling = sock.getsockopt(socket.SOL_SOCKET, opt)
+                granted = min(size, read_sysctl(max_path) or size)
+                if granted > ceiling:
+                    sock.setsockopt(socket.SOL_SOCKET, opt, granted)
+                    name = "SO_SNDBUF" if opt == socket.SO_SNDBUF else "SO_RCVBUF"
+                    changed.append(f"{name}={granted}")
+            if changed:
+                logger.debug(f"Socket buffers set: {' '.join(changed)} (rtt {rtt * 1000:.2f} ms)")
+    return sock
+
+@contextlib.contextmanager
+def corked(sock):
+    """Hold partial segments while writing header+payload, flush on exit."""
+    cork = getattr(socket, "TCP_CORK", None)
+    if cork is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, cork, 1)
+    try:
+        yield sock
+    finally:
+        if cork is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, cork, 0)
+
+# Connection establishment resolves every address of the host and races
+# staggered attempts (RFC 8305 "happy eyeballs"), so one dead address or a
+# broken IPv6 route costs a quarter second instead of a full timeout.
+# Retries back off exponentially with jitter so reconnect storms spread out.
+CONNECT_ATTEMPT_DELAY = 0.25
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+
+def resolve_addresses(host, port):
+    """All stream addresses for host, alternating families starting with IPv6."""
+    infos = socket.getaddrinfo(host, port, socket.AF_UNSPEC, socket.SOCK_STREAM)
+    v6 = [i for i in infos if i[0] == socket.AF_INET6]
+    rest = [i for i in infos if i[0] != socket.AF_INET6]
+    return [i for pair in itertools.zip_longest(v6, rest) for i in pair if i]
+
+def race_connect(addrs, timeout, keepalive):
+    """
+    Start a non-blocking connect to each address, a new one every
+    CONNECT_ATTEMPT_DELAY seconds or as soon as the previous one fails, and
+    return (socket, handshake_seconds) for the first that completes.
+    """
+    addrs = list(addrs)
+    pending = {}
+    errors = []
+    deadline = time.monotonic() + timeout
+    next_start = time.monotonic()
+    try:
+        while addrs or pending:
+            now = time.monotonic()
+            if now >= deadline:
+                errors.append(socket.timeout("timed out"))
+                break
+            if addrs and (now >= next_start or not pending):
+                family, type_, proto, _, sockaddr = addrs.pop(0)
+                try:
+                    sock = socket.socket(family, type_, proto)
+                except OSError as e:
+                    # e.g. EAFNOSUPPORT for an AAAA record on a host without IPv6
+                    errors.append(e)
+                    continue
+                try:
+                    sock.setblocking(False)
+                    if keepalive:
+                        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                    err = sock.connect_ex(sockaddr)
+                except OSError as e:
+                    sock.close()
+                    errors.append(e)
+                    continue
+                if err == 0:
+                    return sock, time.monotonic() - now
+                if err not in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                    sock.close()
+                    errors.append(OSError(err, os.strerror(err)))
+                    continue
+                pending[sock] = now
+                next_start = now + CONNECT_ATTEMPT_DELAY
+                continue
+            wake = min(next_start, deadline) if addrs else deadline
+            socks = list(pending)
+            _, writable, failed = select.select([], socks, socks, max(0.0, wake - now))
+            for sock in set(writable) | set(failed):
+                started = pending.pop(sock)
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err == 0:
+                    return sock, time.monotonic() - started
+                sock.close()
+                errors.append(OSError(err, os.strerror(err)))
+    finally:
+        for sock in pending:
+            sock.close()
+    raise errors[-1] if errors else OSError("no addresses to connect to")
+
+def backoff_delay(attempt):
+    """Exponential backoff with equal jitter for the given retry number (1-based)."""
+    ceiling = min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt - 1))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+def establish_connection(host, port, timeout, retries, keepalive, tls, cafile,
+                         profile=None, link_mbps=100.0):
+    """
+    Connect with timeout and retries. Raises ConnectionError once all
+    retries are used up so long-running callers can decide what to do.
+    """
+    ctx = None
+    if tls:
+        # a bad CA file can't be fixed by retrying
+        try:
+            ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=cafile)
+        except OSError as e:
+            raise ConnectionError(f"TLS setup for {host}:{port} failed: {e}") from e
     attempt = 0
     while True:
+        sock = None
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock, rtt = race_connect(resolve_addresses(host, port), timeout, keepalive)
             sock.settimeout(timeout)
-            if keepalive:
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-            sock.connect((host, port))
-            if tls:
-                ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=cafile)
+            # the handshake time is a fallback RTT sample when TCP_INFO is missing
+            tune_socket(sock, profile, link_mbps, rtt=rtt)
+            if ctx:
                 sock = ctx.wrap_socket(sock, server_hostname=host)
             return sock
-        except Exception as e:
+        except OSError as e:
+            if sock is not None:
+                sock.close()
+            if isinstance(e, ssl.SSLCertVerificationError):
+                # the same certificate will fail the same way on every retry
+                raise ConnectionError(f"Certificate verification for {host}:{port} failed: {e}") from e
             attempt += 1
             if attempt > retries:
-                logger.error(f"Connection failed after {retries} retries: {e}")
-                sys.exit(1)
-            logger.warning(f"Connect attempt {attempt}/{retries} failed, retrying...")
-            time.sleep(1)
+                raise ConnectionError(f"Connection to {host}:{port} failed after {retries} retries: {e}") from e
+            delay = backoff_delay(attempt)
+            logger.warning(f"Connect attempt {attempt}/{retries} failed ({e}), retrying in {delay:.2f}s...")
+            time.sleep(delay)
 
 def wrap_server_socket(sock, tls, certfile, keyfile):
     if tls:
@@ -76,6 +325,176 @@ def wrap_server_socket(sock, tls, certfile, keyfile):
         sock = ctx.wrap_socket(sock, server_side=True)
     return sock
 
+# Bandwidth shaping for the file server and proxy. A global token bucket caps
+# the total send rate. Each connection also gets its own bucket, sized by a
+# max-min fair share of the global rate: connections that use less than an
+# equal share keep what they use (and may burst up to the equal share), and
+# the rest is split between connections that are using all they are given.
+# --conn-rate caps any single connection on top of that. Buckets run into
+# debt instead of refusing a send, and senders only sleep once the debt is
+# worth at least MIN_SHAPING_SLEEP, so a limited stream costs a handful of
+# sleeps per second rather than one per chunk.
+MIN_SHAPING_SLEEP = 0.005
+REBALANCE_INTERVAL = 0.5
+# a connection sending at this fraction of its limit is treated as wanting more
+SATURATION = 0.9
+
+def parse_rate(text):
+    """'512K', '10M', '1G' or plain bytes/sec -> bytes/sec."""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper().rstrip("B")
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+def format_rate(rate):
+    for unit in ("B", "KB", "MB"):
+        if rate < 1024:
+            return f"{rate:.1f}{unit}/s"
+        rate /= 1024
+    return f"{rate:.1f}GB/s"
+
+class TokenBucket:
+    def __init__(self, rate):
+        self.lock = threading.Lock()
+        self.stamp = time.monotonic()
+        self.set_rate(rate)
+        self.tokens = self.burst
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = rate
+            # a quarter second of traffic, never less than one transfer chunk
+            self.burst = max(rate / 4, 64 * 1024)
+
+    def reserve(self, n):
+        """Take n tokens now and return how long the caller owes before sending."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= n
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+class ShapedConnection:
+    def __init__(self, shaper, name):
+        self.shaper = shaper
+        self.name = name
+        self.bucket = None
+        self.window_bytes = 0
+        self.measured = 0.0
+
+    def throttle(self, n):
+        """Account for n bytes about to be sent, sleeping off any large debt."""
+        self.window_bytes += n
+        if time.monotonic() - self.shaper.last_rebalance >= REBALANCE_INTERVAL:
+            self.shaper.rebalance()
+        wait = self.bucket.reserve(n) if self.bucket else 0.0
+        if self.shaper.bucket:
+            wait = max(wait, self.shaper.bucket.reserve(n))
+        if wait >= MIN_SHAPING_SLEEP:
+            time.sleep(wait)
+
+def max_min_shares(demands, capacity):
+    """Water-fill capacity over demands: small demands are met in full and
+    whatever they leave is split evenly between the larger ones."""
+    shares = [0.0] * len(demands)
+    remaining = capacity
+    order = sorted(range(len(demands)), key=lambda i: demands[i])
+    for k, i in enumerate(order):
+        shares[i] = min(demands[i], remaining / (len(order) - k))
+        remaining -= shares[i]
+    return shares
+
+class Shaper:
+    def __init__(self, global_rate=None, conn_rate=None):
+        self.global_rate = global_rate
+        self.conn_rate = conn_rate
+        self.bucket = TokenBucket(global_rate) if global_rate else None
+        self.conns = []
+        self.lock = threading.Lock()
+        self.last_rebalance = time.monotonic()
+
+    def open(self, name):
+        conn = ShapedConnection(self, name)
+        with self.lock:
+            self.conns.append(conn)
+            self._assign_limits()
+        return conn
+
+    def close(self, conn):
+        with self.lock:
+            self.conns.remove(conn)
+            self._assign_limits()
+
+    def rebalance(self):
+        """Close the measurement window and recompute every connection's limit."""
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.last_rebalance
+            if elapsed < REBALANCE_INTERVAL:
+                return
+            self.last_rebalance = now
+            for c in self.conns:
+                c.measured = c.window_bytes / elapsed
+                c.window_bytes = 0
+            self._assign_limits()
+
+    def _assign_limits(self):
+        if not self.global_rate:
+            rates = [self.conn_rate] * len(self.conns)
+        else:
+            equal = self.global_rate / max(1, len(self.conns))
+            demands = []
+            for c in self.conns:
+                wants_more = c.bucket is None or c.measured >= SATURATION * c.bucket.rate
+                demands.append(float("inf") if wants_more else c.measured)
+            # light users may still burst to an equal share; the global
+            # bucket keeps the total in check while the next window adapts
+            rates = [max(share, equal) if d != float("inf") else share
+                     for share, d in zip(max_min_shares(demands, self.global_rate), demands)]
+            if self.conn_rate:
+                rates = [min(r, self.conn_rate) for r in rates]
+        for c, rate in zip(self.conns, rates):
+            if not rate:
+                c.bucket = None
+            elif c.bucket is None:
+                c.bucket = TokenBucket(rate)
+            else:
+                c.bucket.set_rate(rate)
+
+    def stats(self):
+        """Report rates without disturbing the measurement window."""
+        with self.lock:
+            conns = list(self.conns)
+            elapsed = time.monotonic() - self.last_rebalance
+        # once a window is older than a full interval (nobody is sending to
+        # close it) its running total is the better estimate, and so it is
+        # for a connection that has not seen a window close yet
+        rates = [c.window_bytes / elapsed
+                 if elapsed >= REBALANCE_INTERVAL or (not c.measured and elapsed > 0)
+                 else c.measured
+                 for c in conns]
+        limit = format_rate(self.global_rate) if self.global_rate else "unlimited"
+        lines = [f"Shaping: {len(conns)} connections, {format_rate(sum(rates))} of {limit}"]
+        for c, rate in zip(conns, rates):
+            share = format_rate(c.bucket.rate) if c.bucket else "unlimited"
+            lines.append(f"  {c.name}: {format_rate(rate)} (limit {share})")
+        return "\n".join(lines)
+
+def make_shaper(args):
+    """Build a Shaper from --rate/--conn-rate and start its stats reporter."""
+    if not args.rate and not args.conn_rate:
+        return None
+    shaper = Shaper(args.rate, args.conn_rate)
+    if args.stats_interval > 0:
+        def report():
+            while True:
+                time.sleep(args.stats_interval)
+                logger.info(shaper.stats())
+        threading.Thread(target=report, daemon=True).start()
+    return shaper
+
 # 4. BASIC SERVER & CLIENT FOR CHAT & INTERACTIVE SHELL
 def server_mode(args):
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -85,6 +504,7 @@ def server_mode(args):
     logger.info(f"Listening on {args.host}:{args.port}")
     while True:
         conn, addr = s.accept()
+        tune_socket(conn, args.profile, args.link_mbps)
         logger.info(f"New connection from {addr}")
         if args.log:
             add_file_logger(args.log)
@@ -95,7 +515,8 @@ def client_mode(args):
         args.host, args.port,
         timeout=args.timeout, retries=args.retries,
         keepalive=args.keepalive,
-        tls=args.tls, cafile=args.tls_cafile
+        tls=args.tls, cafile=args.tls_cafile,
+        profile=args.profile, link_mbps=args.link_mbps
     )
     logger.info(f"Connected to {args.host}:{args.port}")
     if args.log:
@@ -148,6 +569,7 @@ def reverse_server(args):
     s = wrap_server_socket(s, args.tls, args.tls_cert, args.tls_key)
     logger.info(f"Reverse shell listening on {args.host}:{args.port}")
     conn, addr = s.accept()
+    tune_socket(conn, args.profile, args.link_mbps)
     logger.info(f"Client shell connected: {addr}")
     if args.log:
         add_file_logger(args.log)
@@ -166,7 +588,8 @@ def reverse_client(args):
         args.host, args.port,
         timeout=args.timeout, retries=args.retries,
         keepalive=args.keepalive,
-        tls=args.tls, cafile=args.tls_cafile
+        tls=args.tls, cafile=args.tls_cafile,
+        profile=args.profile, link_mbps=args.link_mbps
     )
     logger.info("Connected back for reverse shell")
     # continuously receive commands
@@ -214,6 +637,90 @@ def reader_shell(conn):
             break
 
 # 6. FILE TRANSFER (UPLOAD & DOWNLOAD)
+# Every transfer is framed as "<size> <algo>\n" + payload + hex digest. The
+# digest is computed inline on both ends while the bytes stream, and the
+# receiver answers "OK" or "BAD"; a BAD transfer is sent again.
+TRANSFER_CHUNK = 64 * 1024
+TRANSFER_RETRIES = 3
+
+def recv_line(sock, limit=256):
+    line = b""
+    while not line.endswith(b"\n") and len(line) < limit:
+        chunk = sock.recv(1)
+        if not chunk:
+            break
+        line += chunk
+    return line.decode(errors="replace").strip()
+
+def send_verified(sock, path, algo, shaped=None):
+    """Send a file with its digest, resending while the receiver reports corruption."""
+    size = os.path.getsize(path)
+    for attempt in range(1, TRANSFER_RETRIES + 1):
+        with open(path, "rb") as f, corked(sock), StreamHasher(algo) as hasher:
+            sock.sendall(f"{size} {algo}\n".encode())
+            while chunk := f.read(TRANSFER_CHUNK):
+                hasher.update(chunk)
+                if shaped:
+                    shaped.throttle(len(chunk))
+                sock.sendall(chunk)
+            digest = hasher.hexdigest()
+            sock.sendall(digest.encode())
+        verdict = recv_line(sock)
+        if verdict == "OK":
+            logger.info(f"Verified {path} ({algo} {digest})")
+            return True
+        if verdict != "BAD":
+            break
+        logger.warning(f"Integrity check failed for {path}, resending ({attempt}/{TRANSFER_RETRIES})")
+    logger.error(f"Could not deliver {path} intact")
+    return False
+
+def recv_verified(sock, path):
+    """
+    Receive a framed file into path, asking for a resend on digest mismatch.
+    Data goes to a temporary file next to path, which only replaces path
+    once a transfer verifies, so no partial or corrupt file is left behind.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".pycat-")
+    os.close(fd)
+    # mkstemp creates 0600 files; received files were world-readable before
+    os.chmod(tmp_path, 0o644)
+    try:
+        while True:
+            header = recv_line(sock)
+            if not header:
+                return False
+            parts = header.split()
+            if len(parts) != 2 or not parts[0].isdigit() or parts[1] not in HASH_ALGORITHMS:
+                logger.error(f"Unexpected transfer header {header[:64]!r}; the peer must "
+                             f"send '<size> <algo>' followed by the file and its digest")
+                return False
+            size, algo = int(parts[0]), parts[1]
+            received = 0
+            with open(tmp_path, "wb") as f, StreamHasher(algo) as hasher:
+                while received < size:
+                    chunk = sock.recv(min(TRANSFER_CHUNK, size - received))
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    f.write(chunk)
+                    received += len(chunk)
+                digest = hasher.hexdigest()
+            expected = recv_exact(sock, len(digest)).decode(errors="replace")
+            if received == size and digest == expected:
+                os.replace(tmp_path, path)
+                sock.sendall(b"OK\n")
+                logger.info(f"Verified {path} ({algo} {digest})")
+                return True
+            if received < size or not expected:
+                logger.error(f"Connection closed during transfer of {path}")
+                return False
+            logger.warning(f"Integrity check failed for {path}, requesting resend")
+            sock.sendall(b"BAD\n")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 def file_server(args):
     """
     In server mode with --upload:
@@ -226,23 +733,25 @@ def file_server(args):
     s.listen()
     logger.info(f"File server listening on {args.host}:{args.port}")
     conn, addr = s.accept()
+    tune_socket(conn, args.profile, args.link_mbps)
     logger.info(f"Transfer connection from {addr}")
     if args.upload:
         # receiving a file from client
         filename = os.path.basename(args.upload)
-        with open(filename, "wb") as f:
-            while True:
-                chunk = conn.recv(4096)
-                if not chunk:
-                    break
-                f.write(chunk)
-        logger.info(f"Saved upload to {filename}")
+        if recv_verified(conn, filename):
+            logger.info(f"Saved upload to {filename}")
     elif args.download:
         # sending a file to client
-        with open(args.download, "rb") as f:
-            while chunk := f.read(4096):
-                conn.sendall(chunk)
-        logger.info(f"Sent file {args.download}")
+        shaper = make_shaper(args)
+        shaped = shaper.open(f"{addr[0]}:{addr[1]}") if shaper else None
+        try:
+            if send_verified(conn, args.download, args.hash, shaped):
+                logger.info(f"Sent file {args.download}")
+        finally:
+            if shaped:
+                # report before close() drops the connection from the stats
+                logger.info(shaper.stats())
+                shaper.close(shaped)
     conn.close()
 
 def file_client(args):
@@ -250,23 +759,18 @@ def file_client(args):
         args.host, args.port,
         timeout=args.timeout, retries=args.retries,
         keepalive=args.keepalive,
-        tls=args.tls, cafile=args.tls_cafile
+        tls=args.tls, cafile=args.tls_cafile,
+        profile=args.profile, link_mbps=args.link_mbps
     )
     if args.upload:
         # client sends local file to server
-        with open(args.upload, "rb") as f:
-            while chunk := f.read(4096):
-                sock.sendall(chunk)
-        logger.info(f"Uploaded {args.upload}")
+        if send_verified(sock, args.upload, args.hash):
+            logger.info(f"Uploaded {args.upload}")
     elif args.download:
         # client writes server file to local path
         outpath = os.path.basename(args.download)
-        with open(outpath, "wb") as f:
-            while chunk := sock.recv(4096):
-                if not chunk:
-                    break
-                f.write(chunk)
-        logger.info(f"Downloaded to {outpath}")
+        if recv_verified(sock, outpath):
+            logger.info(f"Downloaded to {outpath}")
     sock.close()
 
 # 7. PORT SCANNING UTILITY
@@ -285,33 +789,169 @@ def port_scan(args):
     print(f"Open ports on {args.host}: {open_ports}")
 
 # 8. SIMPLE TCP PROXY (PORT FORWARDING)
+# The proxy can record what it relays into a fixed-size ring buffer. All
+# storage is preallocated: one bytearray of packed slot headers (sequence
+# number, timestamp, connection, direction, length) and one holding the first
+# snap_len bytes of every chunk. Writers claim a slot with next() on a shared
+# itertools.count, which is atomic under the GIL, so the relay loop takes no
+# lock and does no logging. SIGUSR1 dumps the buffer to --record (.pcap for
+# a pcap file with a user link type, anything else for JSON).
+CLIENT_TO_SERVER = 0
+SERVER_TO_CLIENT = 1
+PCAP_LINKTYPE_USER0 = 147
+RELAY_CHUNK = 64 * 1024
+
+class TrafficRecorder:
+    # seq, time, conn id, direction, address family, peer port, peer ip, length
+    SLOT = struct.Struct("<QdIBBH16sI")
+    SEQ = struct.Struct("<Q")  # leading field of SLOT
+
+    def __init__(self, slots=65536, snap_len=64):
+        self.slots = slots
+        self.snap_len = snap_len
+        self.meta = bytearray(slots * self.SLOT.size)
+        self.snaps = bytearray(slots * snap_len)
+        self._seq = itertools.count(1)
+        self._next_conn = itertools.count(1)
+        self._pack = self.SLOT.pack_into
+
+    def new_connection(self, addr):
+        """Handle for record(). The peer goes into every slot rather than a
+        per-connection table, so nothing grows as connections come and go."""
+        family = 6 if ":" in addr[0] else 4
+        ip = socket.inet_pton(socket.AF_INET6 if family == 6 else socket.AF_INET, addr[0])
+        return next(self._next_conn), family, addr[1], ip
+
+    def record(self, conn, direction, data):
+        conn_id, family, port, ip = conn
+        seq = next(self._seq)
+        i = seq % self.slots
+        n = min(len(data), self.snap_len)
+        off = i * self.snap_len
+        # mark the slot empty while its snippet is rewritten; entries() skips it
+        self.SEQ.pack_into(self.meta, i * self.SLOT.size, 0)
+        # equal-length slice assignment, the bytearray never resizes
+        self.snaps[off:off + n] = data[:n]
+        self._pack(self.meta, i * self.SLOT.size, seq, time.time(), conn_id, direction,
+                   family, port, ip, len(data))
+
+    def entries(self):
+        """Filled slots oldest first as (seq, time, conn_id, peer, direction, length, snap)."""
+        out = []
+        for i in range(self.slots):
+            seq, ts, conn_id, direction, family, port, ip, length = \
+                self.SLOT.unpack_from(self.meta, i * self.SLOT.size)
+            # a slot with seq 0 has never been filled
+            if not seq:
+                continue
+            if family == 6:
+                peer = f"[{socket.inet_ntop(socket.AF_INET6, ip)}]:{port}"
+            else:
+                peer = f"{socket.inet_ntop(socket.AF_INET, ip[:4])}:{port}"
+            off = i * self.snap_len
+            snap = bytes(self.snaps[off:off + min(length, self.snap_len)])
+            # a relay thread rewrote the slot while it was copied: drop it
+            if self.SEQ.unpack_from(self.meta, i * self.SLOT.size)[0] != seq:
+                continue
+            out.append((seq, ts, conn_id, peer, direction, length, snap))
+        out.sort()
+        return out
+
+    def dump(self, path):
+        entries = self.entries()
+        if path.endswith(".pcap"):
+            self._dump_pcap(path, entries)
+        else:
+            self._dump_json(path, entries)
+        logger.info(f"Recorded {len(entries)} chunks to {path}")
+
+    def _dump_json(self, path, entries):
+        records = [{
+            "seq": seq,
+            "time": ts,
+            "conn": conn_id,
+            "peer": peer,
+            "direction": "c2s" if direction == CLIENT_TO_SERVER else "s2c",
+            "length": length,
+            "data": snap.hex(),
+        } for seq, ts, conn_id, peer, direction, length, snap in entries]
+        with open(path, "w") as f:
+            json.dump({"snap_len": self.snap_len, "records": records}, f, indent=1)
+
+    def _dump_pcap(self, path, entries):
+        # each packet is an 8-byte pseudo header (conn id, direction) + snap
+        with open(path, "wb") as f:
+            f.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0,
+                                self.snap_len + 8, PCAP_LINKTYPE_USER0))
+            for _, ts, conn_id, _, direction, length, snap in entries:
+                sec = int(ts)
+                f.write(struct.pack("<IIII", sec, int((ts - sec) * 1e6),
+                                    len(snap) + 8, length + 8))
+                f.write(struct.pack("<IB3x", conn_id, direction))
+                f.write(snap)
+
 def proxy_mode(args):
     """
     Listen locally, forward all traffic bidirectionally
     to remote_host:remote_port.
     """
-    def handle(client_sock):
-        server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_sock.connect((args.remote_host, args.remote_port))
+    shaper = make_shaper(args)
+    recorder = None
+    if args.record:
+        recorder = TrafficRecorder(args.record_slots, args.record_snap)
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda *_: recorder.dump(args.record))
+            logger.info(f"Recording relayed traffic; send SIGUSR1 to dump to {args.record}")
+        else:
+            logger.warning("SIGUSR1 is not available here, the recording can't be dumped")
+
+    def handle(client_sock, addr):
+        tune_socket(client_sock, args.profile, args.link_mbps)
+        try:
+            server_sock = establish_connection(
+                args.remote_host, args.remote_port,
+                timeout=args.timeout, retries=args.retries,
+                keepalive=args.keepalive, tls=False, cafile=None,
+                profile=args.profile, link_mbps=args.link_mbps
+            )
+        except ConnectionError as e:
+            logger.error(str(e))
+            client_sock.close()
+            return
+        # relay with blocking sockets; select() decides when to read
+        server_sock.settimeout(None)
+        shaped = shaper.open(f"{addr[0]}:{addr[1]}") if shaper else None
+        rec_conn = recorder.new_connection(addr) if recorder else None
         # bidirectional copying
         sockets = [client_sock, server_sock]
-        while True:
-            r, _, _ = select.select(sockets, [], [])
-            for s in r:
-                data = s.recv(4096)
-                if not data:
-                    return
-                # send to the other side
-                dest = server_sock if s is client_sock else client_sock
-                dest.sendall(data)
+        try:
+            while True:
+                r, _, _ = select.select(sockets, [], [])
+                for s in r:
+                    data = s.recv(RELAY_CHUNK)
+                    if not data:
+                        return
+                    # send to the other side
+                    dest = server_sock if s is client_sock else client_sock
+                    if recorder:
+                        direction = CLIENT_TO_SERVER if s is client_sock else SERVER_TO_CLIENT
+                        recorder.record(rec_conn, direction, data)
+                    if shaped:
+                        shaped.throttle(len(data))
+                    dest.sendall(data)
+        finally:
+            if shaped:
+                shaper.close(shaped)
+            client_sock.close()
+            server_sock.close()
 
     listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     listener.bind((args.host, args.port))
     listener.listen()
     logger.info(f"Proxy listening on {args.host}:{args.port} -> {args.remote_host}:{args.remote_port}")
     while True:
-        client, _ = listener.accept()
-        threading.Thread(target=handle, args=(client,), daemon=True).start()
+        client, addr = listener.accept()
+        threading.Thread(target=handle, args=(client, addr), daemon=True).start()
 
 # 9. ARGPARSE & MAIN
 def main():
@@ -330,6 +970,16 @@ def main():
     base.add_argument("--retries", type=int, default=3)
     base.add_argument("--keepalive", action="store_true")
     base.add_argument("--log", help="Log session to file")
+    base.add_argument("--profile", choices=["auto"] + list(TRANSPORT_PROFILES), default="auto",
+                      help="transport tuning profile (auto picks one per mode)")
+    base.add_argument("--link-mbps", type=float, default=100.0,
+                      help="link bandwidth used to size socket buffers")
+
+    shaping = argparse.ArgumentParser(add_help=False)
+    shaping.add_argument("--rate", type=parse_rate, help="total send rate, e.g. 10M (bytes/sec)")
+    shaping.add_argument("--conn-rate", type=parse_rate, help="per-connection send rate cap")
+    shaping.add_argument("--stats-interval", type=float, default=10.0,
+                         help="seconds between shaping stats log lines (0 disables)")
 
     p_s = sub.add_parser("server", parents=[base], help="chat server")
     p_c = sub.add_parser("client", parents=[base], help="chat client")
@@ -339,12 +989,16 @@ def main():
     p_rc = sub.add_parser("reverse-client", parents=[base], help="reverse shell client")
 
     # file transfer
-    p_fu = sub.add_parser("file-server", parents=[base], help="file transfer server")
+    p_fu = sub.add_parser("file-server", parents=[base, shaping], help="file transfer server")
     p_fu.add_argument("--upload", help="save incoming file as this name")
     p_fu.add_argument("--download", help="send this file to client")
+    p_fu.add_argument("--hash", choices=HASH_ALGORITHMS, default=DEFAULT_HASH,
+                      help="integrity hash for files sent")
     p_fc = sub.add_parser("file-client", parents=[base], help="file transfer client")
     p_fc.add_argument("--upload", help="send this local file")
     p_fc.add_argument("--download", help="save incoming file as this name")
+    p_fc.add_argument("--hash", choices=HASH_ALGORITHMS, default=DEFAULT_HASH,
+                      help="integrity hash for files sent")
 
     # port scan
     p_ps = sub.add_parser("scan", help="port scanner")
@@ -354,30 +1008,39 @@ def main():
     p_ps.add_argument("--timeout", type=float, default=0.5)
 
     # proxy
-    p_px = sub.add_parser("proxy", parents=[base], help="TCP proxy/port forward")
+    p_px = sub.add_parser("proxy", parents=[base, shaping], help="TCP proxy/port forward")
     p_px.add_argument("remote_host")
     p_px.add_argument("remote_port", type=int)
+    p_px.add_argument("--record", help="record relayed traffic, dumped here on SIGUSR1 (.pcap or JSON)")
+    p_px.add_argument("--record-slots", type=int, default=65536, help="ring buffer size in chunks")
+    p_px.add_argument("--record-snap", type=int, default=64, help="bytes kept from each chunk")
 
     args = parser.parse_args()
+    if getattr(args, "profile", None) == "auto":
+        args.profile = MODE_PROFILES.get(args.mode, "none")
 
-    if args.mode == "server":
-        server_mode(args)
-    elif args.mode == "client":
-        client_mode(args)
-    elif args.mode == "reverse-server":
-        reverse_server(args)
-    elif args.mode == "reverse-client":
-        reverse_client(args)
-    elif args.mode == "file-server":
-        file_server(args)
-    elif args.mode == "file-client":
-        file_client(args)
-    elif args.mode == "scan":
-        port_scan(args)
-    elif args.mode == "proxy":
-        proxy_mode(args)
-    else:
-        parser.print_help()
+    try:
+        if args.mode == "server":
+            server_mode(args)
+        elif args.mode == "client":
+            client_mode(args)
+        elif args.mode == "reverse-server":
+            reverse_server(args)
+        elif args.mode == "reverse-client":
+            reverse_client(args)
+        elif args.mode == "file-server":
+            file_server(args)
+        elif args.mode == "file-client":
+            file_client(args)
+        elif args.mode == "scan":
+            port_scan(args)
+        elif args.mode == "proxy":
+            proxy_mode(args)
+        else:
+            parser.print_help()
+    except ConnectionError as e:
+        logger.error(str(e))
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
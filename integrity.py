@@ -0,0 +1,60 @@
+import hashlib
+import queue
+import threading
+
+# =========================
+# Streaming integrity hashing shared by client.py, server.py and pycat
+# =========================
+HASH_ALGORITHMS = ("blake2b", "sha256")
+DEFAULT_HASH = "blake2b"
+
+def hex_length(algo):
+    """Length of the hex digest the peer sends after the payload."""
+    return hashlib.new(algo).digest_size * 2
+
+class StreamHasher:
+    """
+    Hash chunks on a worker thread as they pass through a transfer loop.
+    hashlib releases the GIL on large buffers, so the socket loop keeps
+    moving while the digest is computed; no second pass over the file.
+    """
+    def __init__(self, algo=DEFAULT_HASH, depth=64):
+        self._hash = hashlib.new(algo)
+        self._queue = queue.Queue(maxsize=depth)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while (chunk := self._queue.get()) is not None:
+            self._hash.update(chunk)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def update(self, chunk):
+        self._queue.put(chunk)
+
+    def close(self):
+        """Stop the worker thread; safe to call again and after hexdigest()."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def hexdigest(self):
+        self.close()
+        return self._hash.hexdigest()
+
+# =========================
+# Read exactly n bytes (or fewer if the peer disconnects)
+# =========================
+def recv_exact(sock, n):
+    data = b""
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
@@ -0,0 +1,291 @@
+import argparse
+import hashlib
+import os
+import random
+import socket
+import threading
+import time
+
+from integrity import DEFAULT_HASH
+
+# Smaller thread stacks so thousands of simulated clients fit in memory
+threading.stack_size(256 * 1024)
+
+# =========================
+# Shared counters for all simulated clients
+# =========================
+class Stats:
+    """
+    Capacity failures are connects that fail and operations that time out:
+    the server could not keep up. Server errors are connections the server
+    reset or closed mid-operation, or replies that break the protocol.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connected = 0
+        self.failed = 0
+        self.server_errors = 0
+        self.active = 0
+        self.connect_latencies = []
+        self.ack_latencies = {"msg": [], "file": []}
+        self.errors = {}
+
+    def connect_ok(self, latency):
+        with self.lock:
+            self.connected += 1
+            self.active += 1
+            self.connect_latencies.append(latency)
+
+    def connect_failed(self, err):
+        with self.lock:
+            self.failed += 1
+            self._count_error(err)
+
+    def op_failed(self, err):
+        with self.lock:
+            if isinstance(err, socket.timeout):
+                self.failed += 1
+            else:
+                self.server_errors += 1
+            self._count_error(err)
+
+    def _count_error(self, err):
+        name = type(err).__name__
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def ack(self, kind, latency):
+        with self.lock:
+            self.ack_latencies[kind].append(latency)
+
+    def closed(self):
+        with self.lock:
+            self.active -= 1
+
+# =========================
+# Latency helpers
+# =========================
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+def histogram(values, edges_ms=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)):
+    """Bucket latencies (seconds) into millisecond bins, last bin is overflow."""
+    counts = [0] * (len(edges_ms) + 1)
+    for v in values:
+        ms = v * 1000
+        for i, edge in enumerate(edges_ms):
+            if ms <= edge:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    labels = [f"<={e}ms" for e in edges_ms] + [f">{edges_ms[-1]}ms"]
+    return list(zip(labels, counts))
+
+# =========================
+# Server process sampling (Linux /proc)
+# =========================
+def read_proc_status(pid):
+    rss_kb, threads = None, None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss_kb = int(line.split()[1])
+                elif line.startswith("Threads:"):
+                    threads = int(line.split()[1])
+    except OSError:
+        pass
+    return rss_kb, threads
+
+# =========================
+# Simulated client behaviour
+# =========================
+MIX_KINDS = ("msg", "file")
+
+def parse_mix(mix):
+    """'msg=0.8,file=0.2' -> {'msg': 0.8, 'file': 0.2}"""
+    weights = {}
+    for part in mix.split(","):
+        try:
+            kind, weight = part.split("=")
+            weight = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"bad mix entry '{part}', expected kind=weight")
+        kind = kind.strip()
+        if kind not in MIX_KINDS:
+            raise argparse.ArgumentTypeError(f"unknown mix kind '{kind}', choose from {', '.join(MIX_KINDS)}")
+        if weight < 0:
+            raise argparse.ArgumentTypeError(f"mix weight for '{kind}' must not be negative")
+        weights[kind] = weight
+    if not any(weights.values()):
+        raise argparse.ArgumentTypeError("mix needs at least one positive weight")
+    return weights
+
+class ProtocolError(Exception):
+    pass
+
+def recv_ack(sock, expected):
+    data = sock.recv(1024)
+    if not data:
+        raise ConnectionResetError("server closed connection")
+    if data.decode(errors="replace") != expected:
+        raise ProtocolError(f"expected {expected}, got {data[:32]!r}")
+    return data
+
+def send_file_op(sock, name, payload, digest):
+    """Same handshake as client.send_file: header, FILE_SEND, payload, digest."""
+    sock.sendall(f"FILE:{name}|{len(payload)}|{DEFAULT_HASH}".encode())
+    recv_ack(sock, "FILE_SEND")
+    sock.sendall(payload)
+    sock.sendall(digest)
+    recv_ack(sock, "FILE_RECEIVED")
+
+def run_client(args, stats, payload, digest, stop):
+    start = time.perf_counter()
+    try:
+        sock = socket.create_connection((args.host, args.port), timeout=args.timeout)
+    except OSError as e:
+        stats.connect_failed(e)
+        return
+    stats.connect_ok(time.perf_counter() - start)
+
+    kinds = list(args.mix)
+    weights = [args.mix[k] for k in kinds]
+    try:
+        for i in range(args.ops):
+            if stop.is_set():
+                break
+            kind = random.choices(kinds, weights)[0]
+            t0 = time.perf_counter()
+            if args.protocol == "pycat":
+                sock.sendall(f"load test message {i}\n".encode())
+            else:
+                if kind == "file":
+                    send_file_op(sock, f"load_{threading.get_ident()}_{i}.bin", payload, digest)
+                else:
+                    sock.sendall(f"MSG:load test message {i}".encode())
+                    recv_ack(sock, "DELIVERED")
+                stats.ack(kind, time.perf_counter() - t0)
+            if args.think:
+                time.sleep(random.uniform(0, args.think))
+        # hold the connection open so concurrency actually builds up
+        stop.wait(args.hold)
+    except (OSError, ProtocolError) as e:
+        stats.op_failed(e)
+    finally:
+        sock.close()
+        stats.closed()
+
+# =========================
+# Ramp driver and reporter
+# =========================
+def report_line(elapsed, stats, last_connected, interval, pid):
+    with stats.lock:
+        connected, failed, active = stats.connected, stats.failed, stats.active
+        server_errors = stats.server_errors
+    rate = (connected - last_connected) / interval
+    line = (f"[{elapsed:6.1f}s] accepted={connected} failed={failed} "
+            f"server_errors={server_errors} active={active} conn/s={rate:.1f}")
+    if pid:
+        rss_kb, threads = read_proc_status(pid)
+        if rss_kb is not None:
+            line += f" server_rss={rss_kb / 1024:.1f}MB server_threads={threads}"
+    print(line, flush=True)
+    return connected
+
+def print_summary(stats, elapsed):
+    print("\n===== SUMMARY =====")
+    print(f"Duration: {elapsed:.1f}s")
+    print(f"Connections accepted: {stats.connected} ({stats.connected / elapsed:.1f}/s)")
+    print(f"Capacity failures (connect failed or timed out): {stats.failed}")
+    print(f"Server errors (reset, closed or bad reply): {stats.server_errors}")
+    if stats.errors:
+        print(f"Errors: {stats.errors}")
+    print(f"Connect latency p50={percentile(stats.connect_latencies, 50) * 1000:.2f}ms "
+          f"p99={percentile(stats.connect_latencies, 99) * 1000:.2f}ms")
+    for kind, values in stats.ack_latencies.items():
+        if not values:
+            continue
+        print(f"\n{kind.upper()} ack latency ({len(values)} samples): "
+              f"p50={percentile(values, 50) * 1000:.2f}ms "
+              f"p99={percentile(values, 99) * 1000:.2f}ms")
+        for label, count in histogram(values):
+            print(f"  {label:>9} {count}")
+
+def run_load(args):
+    stats = Stats()
+    stop = threading.Event()
+    payload = os.urandom(args.file_size)
+    digest = hashlib.new(DEFAULT_HASH, payload).hexdigest().encode()
+    threads = []
+
+    start = time.perf_counter()
+    next_report = start + args.interval
+    last_connected = 0
+    rate = args.rate
+    spawned = 0
+    next_spawn = start
+
+    try:
+        while spawned < args.clients:
+            now = time.perf_counter()
+            if now >= next_spawn:
+                t = threading.Thread(target=run_client, args=(args, stats, payload, digest, stop), daemon=True)
+                t.start()
+                threads.append(t)
+                spawned += 1
+                next_spawn += 1 / rate
+            if now >= next_report:
+                last_connected = report_line(now - start, stats, last_connected, args.interval, args.server_pid)
+                next_report += args.interval
+                # ramp the connection rate every reporting interval
+                rate = min(args.max_rate, rate + args.ramp)
+            time.sleep(max(0, min(next_spawn, next_report) - time.perf_counter()))
+
+        # keep sampling while clients finish their work
+        while any(t.is_alive() for t in threads):
+            time.sleep(max(0, next_report - time.perf_counter()))
+            now = time.perf_counter()
+            last_connected = report_line(now - start, stats, last_connected, args.interval, args.server_pid)
+            next_report += args.interval
+    except KeyboardInterrupt:
+        print("\n[INTERRUPTED] stopping clients")
+        stop.set()
+
+    print_summary(stats, time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load generator for server.py and pycat server mode"
+    )
+    parser.add_argument("host")
+    parser.add_argument("port", type=int)
+    parser.add_argument("--protocol", choices=["tcp-chat", "pycat"], default="tcp-chat",
+                        help="tcp-chat waits for server.py acks, pycat sends without acks")
+    parser.add_argument("--clients", type=int, default=1000, help="total simulated clients")
+    parser.add_argument("--rate", type=float, default=50.0, help="initial connections/sec")
+    parser.add_argument("--ramp", type=float, default=50.0, help="connections/sec added per interval")
+    parser.add_argument("--max-rate", type=float, default=2000.0, help="connection rate ceiling")
+    parser.add_argument("--ops", type=int, default=10, help="operations per client")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("msg=0.9,file=0.1"),
+                        help="operation profile, e.g. msg=0.8,file=0.2")
+    parser.add_argument("--file-size", type=int, default=64 * 1024, help="bytes per simulated file")
+    parser.add_argument("--think", type=float, default=0.0, help="max random pause between ops (s)")
+    parser.add_argument("--hold", type=float, default=5.0, help="keep each connection open (s)")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--interval", type=float, default=1.0, help="reporting interval (s)")
+    parser.add_argument("--server-pid", type=int, help="sample RSS/threads of this server process")
+    args = parser.parse_args()
+
+    if args.protocol == "pycat" and "file" in args.mix:
+        # pycat chat has no file framing; everything is sent as chat text
+        args.mix = {"msg": 1.0}
+
+    run_load(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
+import argparse
 import socket
+import string
 import threading
 import os
 import sys
 
+from content_store import ContentStore
+from integrity import DEFAULT_HASH, HASH_ALGORITHMS, StreamHasher, hex_length, recv_exact
+
+CHUNK_SIZE = 64 * 1024
+
 # =========================
 # Helper function for progress display
 # =========================
@@ -14,7 +21,7 @@ def print_progress(sent, total):
 # =========================
 # Handle each client connection
 # =========================
-def handle_client(conn, addr):
+def handle_client(conn, addr, store):
     print(f"[NEW CONNECTION] {addr} connected.")
 
     try:
@@ -30,24 +37,65 @@ def handle_client(conn, addr):
                 conn.sendall(b"DELIVERED") # Acknowledge
 
             elif header.startswith("FILE:"): # File transfer
-                filename, filesize = header[5:].split("|")
+                # FILE:<name>|<size>[|<algo>[|<digest>]]
+                # With an algo the client waits for FILE_SEND (or FILE_EXISTS when
+                # the announced digest is already stored) before the payload, and
+                # without an announced digest it sends the digest after the payload.
+                filename, filesize, *rest = header[5:].split("|")
+                filename = os.path.basename(filename)
                 filesize = int(filesize)
+                algo = rest[0] if rest and rest[0] in HASH_ALGORITHMS else None
+                announced = rest[1] if algo and len(rest) > 1 else None
+                if announced and (len(announced) != hex_length(algo)
+                                  or not set(announced) <= set(string.hexdigits.lower())):
+                    # the digest names a path in the store; refuse anything else
+                    print(f"[BAD HEADER] invalid {algo} digest from {addr}, closing")
+                    break
 
-                # Create received_files directory if it doesn't exist
-                os.makedirs("received_files", exist_ok=True)
+                if announced and store.link(algo, announced, filename):
+                    print(f"[DEDUP] '{filename}' from {addr} already stored, transfer skipped")
+                    conn.sendall(b"FILE_EXISTS")
+                    continue
+                if algo:
+                    conn.sendall(b"FILE_SEND")
 
                 print(f"[FILE TRANSFER] Receiving '{filename}' ({filesize} bytes) from {addr}")
-                with open(f"received_files/received_{filename}", "wb") as f:
-                    received = 0
-                    while received < filesize:
-                        data = conn.recv(1024)
-                        if not data:
-                            break
-                        f.write(data)
-                        received += len(data)
-                        print_progress(received, filesize)
-                print("\n[TRANSFER COMPLETE]")
-                conn.sendall(b"FILE_RECEIVED") # Acknowledge
+                f, tmp_path = store.incoming()
+                try:
+                    # Every upload is hashed so it can be stored by content
+                    with f, StreamHasher(algo or DEFAULT_HASH) as hasher:
+                        received = 0
+                        while received < filesize:
+                            # never read past the payload into the digest or next header
+                            data = conn.recv(min(CHUNK_SIZE, filesize - received))
+                            if not data:
+                                break
+                            hasher.update(data)
+                            f.write(data)
+                            received += len(data)
+                            print_progress(received, filesize)
+                        digest = hasher.hexdigest()
+                    print("\n[TRANSFER COMPLETE]")
+
+                    if received < filesize:
+                        break
+
+                    expected = announced
+                    if algo and not announced:
+                        expected = recv_exact(conn, hex_length(algo)).decode(errors="replace")
+                    if expected is not None:
+                        if digest != expected:
+                            print(f"[INTEGRITY CHECK FAILED] '{filename}' from {addr}")
+                            conn.sendall(b"FILE_CORRUPT")
+                            continue
+                        print(f"[INTEGRITY OK] {algo} {expected}")
+                    store.add(tmp_path, algo or DEFAULT_HASH, digest, filename)
+                    tmp_path = None
+                    conn.sendall(b"FILE_RECEIVED") # Acknowledge
+                finally:
+                    # failed, corrupt or interrupted uploads must not linger in the store
+                    if tmp_path and os.path.exists(tmp_path):
+                        os.remove(tmp_path)
 
     except ConnectionResetError:
         print(f"[DISCONNECTED] {addr}")
@@ -57,7 +105,10 @@ def handle_client(conn, addr):
 # =========================
 # Main TCP server function
 # =========================
-def start_server(host="0.0.0.0", port=8888):
+def start_server(host="0.0.0.0", port=8888, store_dir="received_files", max_store_bytes=None):
+    # Uploads are kept once per content; max_store_bytes caps the store size
+    store = ContentStore(store_dir, max_store_bytes)
+
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server.bind((host, port))
     server.listen()
@@ -66,9 +117,19 @@ def start_server(host="0.0.0.0", port=8888):
 
     while True:
         conn, addr = server.accept()
-        thread = threading.Thread(target=handle_client, args=(conn, addr), daemon=True)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        thread = threading.Thread(target=handle_client, args=(conn, addr, store), daemon=True)
         thread.start()
         print(f"[ACTIVE CONNECTIONS] {threading.active_count() - 1}")
 
 if __name__ == "__main__":
-    start_server()
+    parser = argparse.ArgumentParser(description="TCP chat and file transfer server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8888)
+    parser.add_argument("--store-dir", default="received_files", help="where received files are kept")
+    parser.add_argument("--max-store-mb", type=float,
+                        help="evict least recently used files beyond this size (default: unlimited)")
+    args = parser.parse_args()
+
+    max_store_bytes = int(args.max_store_mb * 1024 * 1024) if args.max_store_mb else None
+    start_server(args.host, args.port, args.store_dir, max_store_bytes)